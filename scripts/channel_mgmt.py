@@ -1,11 +1,16 @@
 import argparse
+import re
 import sys
-from config_loader import get_env_var
-from mm_client import MattermostClient
-from utils import setup_logging, get_logger
+from config_loader import get_auth_config
+from mm_client import build_client
+from utils import setup_logging, get_logger, slugify
 
 logger = get_logger(__name__)
 
+# Team channels are a single letter or letter+digit (e.g. H1, D, A2); members
+# of those channels get channel admin rights.
+TEAM_CHANNEL_RE = re.compile(r"^[A-Za-z]\d?$")
+
 def parse_args():
     parser = argparse.ArgumentParser(description="Manage channel membership.")
     parser.add_argument("--email", required=True, help="User email")
@@ -25,18 +30,7 @@ def main():
         return
 
     try:
-        url = get_env_var("MM_URL", required=True)
-        token = get_env_var("MM_TOKEN")
-        if not token:
-             admin_user = get_env_var("MM_ADMIN_USER")
-             admin_pass = get_env_var("MM_ADMIN_PASS")
-             if admin_user and admin_pass:
-                 client = MattermostClient.login(url, admin_user, admin_pass)
-             else:
-                 logger.error("MM_TOKEN or Credentials required.")
-                 sys.exit(1)
-        else:
-            client = MattermostClient(url, token)
+        client = build_client(get_auth_config())
     except Exception as e:
         logger.error(f"Auth failed: {e}")
         sys.exit(1)
@@ -52,7 +46,7 @@ def main():
         sys.exit(1)
 
     # Normalize channel name
-    chan_slug = args.channel.lower().replace(" ", "-")
+    chan_slug = slugify(args.channel)
     channel = client.get_channel_by_name(team["id"], chan_slug)
     if not channel:
         logger.error(f"Channel not found: {args.channel} (slug: {chan_slug})")
@@ -61,8 +55,7 @@ def main():
     if args.action == "add":
         logger.info(f"Adding {args.email} to {args.channel}")
         client.add_user_to_channel(channel["id"], user["id"])
-        import re
-        if re.match(r"^[A-Za-z]\d?$", args.channel):
+        if TEAM_CHANNEL_RE.match(args.channel):
             logger.info(f"Setting channel admin roles for {args.email} in '{args.channel}'")
             client.set_channel_member_roles(channel["id"], user["id"], "channel_user channel_admin")
     elif args.action == "remove":
@@ -1,18 +1,27 @@
+import functools
 import os
 import yaml
-from typing import Dict, Any
+from dataclasses import dataclass
+from typing import Dict, Any, Optional
 from dotenv import load_dotenv
 
+try:
+    # C-accelerated loader; much faster than the pure-Python SafeLoader
+    from yaml import CSafeLoader as _YamlLoader
+except ImportError:
+    from yaml import SafeLoader as _YamlLoader
+
 # Load .env file from the root of the repo (assuming script is run from scripts/)
 # Adjust path to find .env one level up
 ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
 load_dotenv(os.path.join(ROOT_DIR, ".env"))
 
+@functools.lru_cache(maxsize=8)
 def load_config(config_path: str = "config.yaml") -> Dict[str, Any]:
-    """Loads configuration from a YAML file."""
+    """Loads configuration from a YAML file. Cached per path for the process."""
     try:
         with open(config_path, "r") as f:
-            config = yaml.safe_load(f)
+            config = yaml.load(f, Loader=_YamlLoader)
         return config if config else {}
     except FileNotFoundError:
         # Fallback to looking in the same directory as the script if not found via relative path
@@ -20,7 +29,7 @@ def load_config(config_path: str = "config.yaml") -> Dict[str, Any]:
         abs_path = os.path.join(script_dir, config_path)
         try:
              with open(abs_path, "r") as f:
-                config = yaml.safe_load(f)
+                config = yaml.load(f, Loader=_YamlLoader)
              return config if config else {}
         except FileNotFoundError:
             raise FileNotFoundError(f"Configuration file not found: {config_path}")
@@ -33,3 +42,21 @@ def get_env_var(name: str, default: str = None, required: bool = False) -> str:
     if required and not value:
         raise ValueError(f"Missing required environment variable: {name}")
     return value
+
+@dataclass(frozen=True)
+class AuthConfig:
+    """Mattermost connection settings read from the environment."""
+    url: str
+    token: Optional[str] = None
+    admin_user: Optional[str] = None
+    admin_pass: Optional[str] = None
+
+@functools.lru_cache(maxsize=1)
+def get_auth_config() -> AuthConfig:
+    """Reads the MM_* auth settings once per process."""
+    return AuthConfig(
+        url=get_env_var("MM_URL", required=True),
+        token=get_env_var("MM_TOKEN"),
+        admin_user=get_env_var("MM_ADMIN_USER"),
+        admin_pass=get_env_var("MM_ADMIN_PASS"),
+    )
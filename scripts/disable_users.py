@@ -1,66 +1,83 @@
 import argparse
 import csv
 import sys
-from config_loader import get_env_var
-from mm_client import MattermostClient
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterator
+from config_loader import get_auth_config
+from mm_client import MattermostClient, build_client
 from utils import setup_logging, get_logger
 
 logger = get_logger(__name__)
 
-def parse_args():
+# Each disable is a lookup plus a DELETE, so a few threads hide most of the
+# round-trip latency without hammering the server.
+DISABLE_WORKERS = 8
+
+def iter_emails(path: str) -> Iterator[str]:
+    """Yields email addresses from a file (plain list or CSV with header)."""
+    with open(path, "r", encoding='utf-8-sig') as f:
+        first_line = f.readline()
+        if not first_line:
+            return
+
+        # Check if first line is a header
+        header = first_line.strip().lower()
+        has_header = "email" in header or "," in header
+
+        if has_header:
+            # One header scan records the email column; rows then stay plain
+            # lists instead of a dict per row.
+            header_fields = next(csv.reader([first_line]), [])
+            lowered = [name.strip().lower() for name in header_fields]
+            email_idx = lowered.index("email") if "email" in lowered else 0
+
+            for row in csv.reader(f):
+                if not row or email_idx >= len(row):
+                    continue
+                email = row[email_idx].strip()
+                if "@" in email: # Simple heuristic
+                    yield email
+        else:
+            # Simple list
+            f.seek(0)
+            for line in f:
+                line = line.strip()
+                if line and "@" in line and line.lower() != "email":
+                    yield line
+
+def disable_email(client: MattermostClient, email: str):
+    """Looks up a single user by email and disables them."""
+    user = client.get_user_by_email(email)
+    if user:
+        logger.info(f"Disabling {email} (ID: {user['id']})")
+        client.disable_user(user["id"])
+    else:
+        logger.warning(f"User not found: {email}")
+
+def parse_args(argv=None):
     """Parses command-line arguments for the user disable script."""
     parser = argparse.ArgumentParser(description="Disable Mattermost users.")
     parser.add_argument("emails", nargs="*", help="List of emails to disable")
     parser.add_argument("--file", help="File containing list of emails (one per line)")
     parser.add_argument("--execute", action="store_true", help="Apply changes")
     parser.add_argument("--debug", action="store_true", help="Enable debug logging")
-    return parser.parse_args()
+    return parser.parse_args(argv)
 
-def main():
-    args = parse_args()
+def main(argv=None):
+    args = parse_args(argv)
     setup_logging(args.debug)
 
     emails = args.emails
     if args.file:
         try:
-            with open(args.file, "r", encoding='utf-8-sig') as f:
-                # Read all lines first to avoid seek issues with some file-like objects
-                lines = [line.strip() for line in f if line.strip()]
-
-                if not lines:
-                    return
-
-                # Check if first line is a header
-                first_line = lines[0].lower()
-                has_header = "email" in first_line or "," in first_line
-
-                if has_header:
-                    # Parse as CSV from the original file (re-opened or sought)
-                    f.seek(0)
-                    reader = csv.DictReader(f)
-                    if reader.fieldnames:
-                         # Normalize headers to lowercase
-                         reader.fieldnames = [name.lower() for name in reader.fieldnames]
-
-                    for row in reader:
-                        email = row.get("email")
-                        if not email and row:
-                            # Fallback to first column if 'email' key missing but row exists
-                            first_val = list(row.values())[0]
-                            if "@" in first_val: # Simple heuristic
-                                email = first_val
-
-                        if email and "@" in email:
-                            emails.append(email.strip())
-                else:
-                    # Simple list
-                    for line in lines:
-                        if "@" in line and line.lower() != "email":
-                            emails.append(line)
+            emails.extend(iter_emails(args.file))
         except FileNotFoundError:
             logger.error(f"File not found: {args.file}")
             sys.exit(1)
 
+    # Dedupe while keeping first-seen order; export files often repeat addresses.
+    emails = list(dict.fromkeys(emails))
+
     if not emails:
         logger.error("No emails provided.")
         sys.exit(1)
@@ -72,29 +89,15 @@ def main():
 
     # Auth
     try:
-        url = get_env_var("MM_URL", required=True)
-        token = get_env_var("MM_TOKEN")
-        if not token:
-             admin_user = get_env_var("MM_ADMIN_USER")
-             admin_pass = get_env_var("MM_ADMIN_PASS")
-             if admin_user and admin_pass:
-                 client = MattermostClient.login(url, admin_user, admin_pass)
-             else:
-                 logger.error("MM_TOKEN or Credentials required.")
-                 sys.exit(1)
-        else:
-            client = MattermostClient(url, token)
+        client = build_client(get_auth_config())
     except Exception as e:
         logger.error(f"Auth failed: {e}")
         sys.exit(1)
 
-    for email in emails:
-        user = client.get_user_by_email(email)
-        if user:
-            logger.info(f"Disabling {email} (ID: {user['id']})")
-            client.disable_user(user["id"])
-        else:
-            logger.warning(f"User not found: {email}")
+    with ThreadPoolExecutor(max_workers=DISABLE_WORKERS) as executor:
+        futures = [executor.submit(disable_email, client, email) for email in emails]
+        for future in futures:
+            future.result()
 
 if __name__ == "__main__":
     main()
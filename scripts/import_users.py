@@ -2,14 +2,133 @@ import csv
 import argparse
 import sys
 import re
-from typing import Dict
-from config_loader import load_config, get_env_var
-from mm_client import MattermostClient, TeamMemberLimitExceededError
-from utils import setup_logging, get_logger
+import threading
+import requests
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+from config_loader import load_config, get_auth_config
+from mm_client import MattermostClient, TeamMemberLimitExceededError, build_client
+from utils import setup_logging, get_logger, slugify
 
 logger = get_logger(__name__)
 
-def parse_args():
+# Number of rows processed concurrently. The import is network-bound (several
+# API calls per row), so a small pool of threads hides most of the latency.
+IMPORT_WORKERS = 4
+
+# Compiled once; used to sanitize name parts for every generated username.
+USERNAME_CLEAN_RE = re.compile(r"[^a-z0-9]")
+
+# Team channels are a single letter or letter+digit (e.g. H1, D, A2); members
+# of those channels get channel admin rights.
+TEAM_CHANNEL_RE = re.compile(r"^[A-Za-z]\d?$")
+
+# Username probing re-checks the same candidates for users sharing a first
+# name, so both hits and misses are remembered for the run. Created users are
+# inserted as taken so later rows in the same batch see them immediately.
+_username_cache: Dict[str, Optional[Dict]] = {}
+_username_cache_lock = threading.Lock()
+
+def lookup_username(client: MattermostClient, username: str) -> Optional[Dict]:
+    """Returns a user by username, memoizing hits and misses for this run."""
+    with _username_cache_lock:
+        if username in _username_cache:
+            return _username_cache[username]
+    user = client.get_user_by_username(username)
+    with _username_cache_lock:
+        _username_cache[username] = user
+    return user
+
+def mark_username_taken(username: str, user: Dict):
+    """Records a username as taken (e.g. right after creating the user)."""
+    with _username_cache_lock:
+        _username_cache[username] = user
+
+def probe_usernames(client: MattermostClient, candidates: List[str]):
+    """Resolves a batch of username candidates in one request.
+
+    Seeds the username cache for every candidate not already known, so the
+    per-candidate checks that follow are cache hits instead of one GET each.
+    Already-cached entries are left alone: a name taken by an earlier row in
+    this batch must not be reset to free.
+    """
+    with _username_cache_lock:
+        unknown = [c for c in candidates if c not in _username_cache]
+    if not unknown:
+        return
+    try:
+        found = {user["username"]: user for user in client.get_users_by_usernames(unknown)}
+    except Exception as e:
+        # lookup_username falls back to per-name GETs if the batch call fails.
+        logger.debug("Batch username probe failed, falling back to single lookups: %s", e)
+        return
+    with _username_cache_lock:
+        for candidate in unknown:
+            _username_cache.setdefault(candidate, found.get(candidate))
+
+# Plain channel memberships (no role changes needed) are collected per channel
+# while rows are processed and flushed in one bulk request per channel.
+_pending_channel_adds: Dict[str, list] = {}
+_pending_channel_adds_lock = threading.Lock()
+
+def queue_channel_add(channel_id: str, user_id: str):
+    """Queues a channel membership for the bulk flush at the end of the run."""
+    with _pending_channel_adds_lock:
+        _pending_channel_adds.setdefault(channel_id, []).append(user_id)
+
+def flush_channel_adds(client: MattermostClient):
+    """Sends the queued channel memberships in bulk requests per channel."""
+    with _pending_channel_adds_lock:
+        pending = dict(_pending_channel_adds)
+        _pending_channel_adds.clear()
+    for channel_id, user_ids in pending.items():
+        # Cap the batch size so a huge channel doesn't turn into one
+        # oversized request.
+        for start in range(0, len(user_ids), 100):
+            try:
+                client.add_users_to_channel(channel_id, user_ids[start:start + 100])
+            except Exception as e:
+                logger.error(f"Failed to add users to channel {channel_id}: {e}")
+
+def get_or_create_team(client: MattermostClient, slug: str, display_name: str) -> Optional[Dict]:
+    """Finds or creates a team, tolerating a concurrent create.
+
+    Rows run in parallel, so two of them can see the same team missing and
+    race the create; the loser gets a 400 from the server and re-fetches the
+    winner's team instead of failing its whole row.
+    """
+    team = client.get_team_by_name(slug)
+    if team:
+        return team
+    logger.info("Team '%s' (%s) not found. Attempting to create...", display_name, slug)
+    try:
+        return client.create_team(slug, display_name)
+    except requests.exceptions.HTTPError:
+        return client.get_team_by_name(slug)
+
+def get_or_create_channel(client: MattermostClient, team_id: str, slug: str, display_name: str) -> Optional[Dict]:
+    """Finds or creates a private channel, tolerating a concurrent create."""
+    channel = client.get_channel_by_name(team_id, slug)
+    if channel:
+        return channel
+    logger.info("Channel '%s' not found. Creating...", display_name)
+    try:
+        return client.create_channel(team_id, slug, display_name, "P")
+    except requests.exceptions.HTTPError:
+        return client.get_channel_by_name(team_id, slug)
+
+def prewarm_channel_cache(client: MattermostClient, config: Dict):
+    """Warms the client's channel cache with one paginated list call."""
+    target_team_name = config.get("default_team")
+    if not target_team_name:
+        return
+    team = client.get_team_by_name(slugify(target_team_name))
+    if not team:
+        return
+    channels = client.get_channels_for_team(team["id"])
+    logger.debug(f"Prewarmed channel cache with {len(channels)} channels for team '{target_team_name}'")
+
+def parse_args(argv=None):
     """Parses command-line arguments for the user import script."""
     parser = argparse.ArgumentParser(description="Import users from CSV to Mattermost.")
     parser.add_argument("--csv", required=True, help="Path to users.csv file")
@@ -17,7 +136,7 @@ def parse_args():
     parser.add_argument("--execute", action="store_true", help="Commit changes (required if wet-run not enabled in config)")
     parser.add_argument("--sync-team", action="store_true", help="Remove users from the default team if they are not in the CSV")
     parser.add_argument("--debug", action="store_true", help="Enable debug logging")
-    return parser.parse_args()
+    return parser.parse_args(argv)
 
 def generate_unique_username(firstname: str, lastname: str, client: MattermostClient, dry_run: bool) -> str:
     """
@@ -26,7 +145,7 @@ def generate_unique_username(firstname: str, lastname: str, client: MattermostCl
     """
     # Sanitize inputs (lowercase, remove invalid chars)
     def clean(s):
-        return re.sub(r'[^a-z0-9]', '', s.lower())
+        return USERNAME_CLEAN_RE.sub('', s.lower())
 
     clean_first = clean(firstname)
     clean_last = clean(lastname)
@@ -45,21 +164,21 @@ def generate_unique_username(firstname: str, lastname: str, client: MattermostCl
     if dry_run:
         return candidate # Just return base for logs
 
-    # Check if taken
-    if not client.get_user_by_username(candidate):
-        return candidate
-
-    # Try appending lastname parts
-    for i in range(1, len(clean_last) + 1):
-        candidate = f"{clean_first}{clean_last[:i]}"
-        if not client.get_user_by_username(candidate):
+    # Resolve the whole candidate ladder in one batch call, then walk it
+    # against the (now warm) cache: base name first, then lastname prefixes.
+    candidates = [clean_first] + [
+        f"{clean_first}{clean_last[:i]}" for i in range(1, len(clean_last) + 1)
+    ]
+    probe_usernames(client, candidates)
+    for candidate in candidates:
+        if not lookup_username(client, candidate):
             return candidate
 
     # Fallback: Append numbers
     counter = 1
     while True:
         candidate = f"{clean_first}{clean_last}{counter}"
-        if not client.get_user_by_username(candidate):
+        if not lookup_username(client, candidate):
             return candidate
         counter += 1
 
@@ -74,30 +193,51 @@ def process_row(row: Dict[str, str], config: Dict, client: MattermostClient, dry
     tags_csv = row.get("tags", "").strip() # This is now the Position
 
     if not email:
-        logger.warning(f"Skipping row with missing email: {row}")
+        logger.warning("Skipping row with missing email: %s", row)
+        return
+
+    if dry_run:
+        # Plan from the CSV alone; no HTTP calls.
+        logger.info("Creating user: %s (Position: %s)", email, tags_csv)
+        target_team_name = config.get("default_team")
+        if target_team_name:
+            logger.info("Adding %s to team '%s'", email, target_team_name)
+        for chan_name in config.get("default_channels", []):
+            logger.info("Adding %s to channel '%s'", email, chan_name)
+        if team_csv:
+            logger.info("Adding %s to channel '%s'", email, team_csv)
+        tags_list = [t.strip().lower() for t in tags_csv.split(",") if t.strip()]
+        for target_label in ["captain", "trainer", "tc"]:
+            if target_label in tags_list:
+                logger.info("Adding %s to channel '%s'", email, target_label.capitalize())
         return
 
-    username = email.split("@")[0] # Simple username generation
+    username = email.partition("@")[0] # Simple username generation (no intermediate list)
 
     try:
         # 1. Create/Update User with Position
         user = client.get_user_by_email(email)
         if user:
             if user.get("delete_at", 0) > 0:
-                logger.info(f"User {email} is disabled (archived). Reactivating...")
+                logger.info("User %s is disabled (archived). Reactivating...", email)
                 if not dry_run:
                     client.activate_user(user["id"])
 
-            logger.info(f"User exists: {email}")
+            logger.info("User exists: %s", email)
             if not dry_run:
                 client.update_user(user["id"], firstname, lastname, position=tags_csv, nickname=firstname)
         else:
-            logger.info(f"Creating user: {email} (Position: {tags_csv})")
+            logger.info("Creating user: %s (Position: %s)", email, tags_csv)
             if not dry_run:
-                user = client.create_user(email, username, firstname, lastname, position=tags_csv, nickname=firstname)
+                try:
+                    user = client.create_user(email, username, firstname, lastname, position=tags_csv, nickname=firstname)
+                except requests.exceptions.HTTPError:
+                    # Duplicate rows can race the create; use the winner's user.
+                    user = client.get_user_by_email(email)
                 if not user:
-                    logger.error(f"Failed to create user {email}")
+                    logger.error("Failed to create user %s", email)
                     return
+                mark_username_taken(username, user)
 
         if dry_run or not user:
             return
@@ -110,21 +250,17 @@ def process_row(row: Dict[str, str], config: Dict, client: MattermostClient, dry
             logger.error("No 'default_team' defined in config.yaml")
             return
 
-        target_team_slug = target_team_name.lower().replace(" ", "-")
-        team = client.get_team_by_name(target_team_slug)
-
-        # Auto-create default team if missing (safety net)
-        if not team:
-            logger.info(f"Default Team '{target_team_name}' ({target_team_slug}) not found. Attempting to create...")
-            if not dry_run:
-                team = client.create_team(target_team_slug, target_team_name)
+        # Resolved upfront by main(); this is a cache hit on the happy path
+        # and a conflict-tolerant safety net otherwise.
+        target_team_slug = slugify(target_team_name)
+        team = get_or_create_team(client, target_team_slug, target_team_name)
 
         if not team:
-            logger.error(f"Default team '{target_team_name}' could not be found or created.")
+            logger.error("Default team '%s' could not be found or created.", target_team_name)
             return
 
         # 3. Add User to Team
-        logger.info(f"Adding {email} to team '{target_team_name}'")
+        logger.info("Adding %s to team '%s'", email, target_team_name)
         if not dry_run:
             client.add_user_to_team(team["id"], user_id)
 
@@ -132,47 +268,47 @@ def process_row(row: Dict[str, str], config: Dict, client: MattermostClient, dry
 
         # 4. Add to Default Channels
         for chan_name in config.get("default_channels", []):
-            chan_slug = chan_name.lower().replace(" ", "-")
+            chan_slug = slugify(chan_name)
             channel = client.get_channel_by_name(team["id"], chan_slug)
             if channel:
                  if not dry_run:
                     try:
-                        client.add_user_to_channel(channel["id"], user_id)
-                        # Check if user is Bestuur to grant admin rights in public default channels
+                        # Bestuur members get admin rights in public default channels,
+                        # which requires the membership to exist first.
                         if "bestuur" in tags_list and channel["type"] == "O":
+                            client.add_user_to_channel(channel["id"], user_id)
                             client.set_channel_member_roles(channel["id"], user_id, "channel_user channel_admin")
+                        else:
+                            queue_channel_add(channel["id"], user_id)
                     except Exception as e:
-                        logger.error(f"Failed to add {email} to default channel {chan_name}: {e}")
+                        logger.error("Failed to add %s to default channel %s: %s", email, chan_name, e)
             else:
-                logger.warning(f"Default channel '{chan_name}' not found in team '{target_team_name}'")
+                logger.warning("Default channel '%s' not found in team '%s'", chan_name, target_team_name)
 
         # 5. Add to 'Team' Channel (from CSV)
         if team_csv:
             chan_name = team_csv
-            chan_slug = chan_name.lower().replace(" ", "-")
-            channel = client.get_channel_by_name(team["id"], chan_slug)
-
-            if not channel:
-                 logger.info(f"Channel '{chan_name}' not found. Creating...")
-                 if not dry_run:
-                     channel = client.create_channel(team["id"], chan_slug, chan_name, "P")
+            chan_slug = slugify(chan_name)
+            channel = get_or_create_channel(client, team["id"], chan_slug, chan_name)
 
             if channel:
                 # Ensure it's private if it exists and is public
                 if channel["type"] == "O":
-                     logger.info(f"Channel '{chan_name}' is public. Converting to private...")
+                     logger.info("Channel '%s' is public. Converting to private...", chan_name)
                      if not dry_run:
                          client.update_channel_privacy(channel["id"], "P")
-                logger.info(f"Adding {email} to channel '{chan_name}'")
+                logger.info("Adding %s to channel '%s'", email, chan_name)
                 if not dry_run:
                     try:
-                        client.add_user_to_channel(channel["id"], user_id)
-                        if re.match(r"^[A-Za-z]\d?$", team_csv):
+                        if TEAM_CHANNEL_RE.match(team_csv):
+                            client.add_user_to_channel(channel["id"], user_id)
                             client.set_channel_member_roles(channel["id"], user_id, "channel_user channel_admin")
+                        else:
+                            queue_channel_add(channel["id"], user_id)
                     except Exception as e:
-                        logger.error(f"Failed to add/update roles for {email} in channel {chan_name}: {e}")
+                        logger.error("Failed to add/update roles for %s in channel %s: %s", email, chan_name, e)
             else:
-                logger.error(f"Could not find or create channel '{chan_name}'")
+                logger.error("Could not find or create channel '%s'", chan_name)
 
         # 6. Add to Label Channels (e.g. 'captain', 'trainer', 'tc')
         if tags_csv:
@@ -180,45 +316,39 @@ def process_row(row: Dict[str, str], config: Dict, client: MattermostClient, dry
                 if target_label in tags_list:
                     chan_name = target_label.capitalize()
                     chan_slug = target_label
-                    channel = client.get_channel_by_name(team["id"], chan_slug)
-
-                    if not channel:
-                        logger.info(f"Channel '{chan_name}' not found. Creating...")
-                        if not dry_run:
-                            channel = client.create_channel(team["id"], chan_slug, chan_name, "P")
+                    channel = get_or_create_channel(client, team["id"], chan_slug, chan_name)
 
                     if channel:
                         if channel["type"] == "O":
-                            logger.info(f"Channel '{chan_name}' is public. Converting to private...")
+                            logger.info("Channel '%s' is public. Converting to private...", chan_name)
                             if not dry_run:
                                 client.update_channel_privacy(channel["id"], "P")
 
-                        logger.info(f"Adding {email} to channel '{chan_name}'")
+                        logger.info("Adding %s to channel '%s'", email, chan_name)
                         if not dry_run:
                             try:
-                                client.add_user_to_channel(channel["id"], user_id)
                                 if target_label == "tc":
+                                    client.add_user_to_channel(channel["id"], user_id)
                                     client.set_channel_member_roles(channel["id"], user_id, "channel_user channel_admin")
+                                else:
+                                    queue_channel_add(channel["id"], user_id)
                             except Exception as e:
-                                logger.error(f"Failed to add {email} to channel {chan_name}: {e}")
+                                logger.error("Failed to add %s to channel %s: %s", email, chan_name, e)
 
     except TeamMemberLimitExceededError:
-        logger.warning(f"Skipping channel assignments for {email}: Default Team is full.")
+        logger.warning("Skipping channel assignments for %s: Default Team is full.", email)
     except Exception as e:
-        logger.error(f"Error processing row for {email}: {e}")
+        logger.error("Error processing row for %s: %s", email, e)
 
-    except Exception as e:
-        logger.error(f"Error processing row for {email}: {e}")
-
-def sync_team_members(csv_rows: list[Dict], config: Dict, client: MattermostClient, dry_run: bool):
+def sync_team_members(csv_emails: set, config: Dict, client: MattermostClient, dry_run: bool):
     """
-    Removes users from the default team if they are not in the CSV.
+    Removes users from the default team if their email is not in csv_emails.
     """
     target_team_name = config.get("default_team")
     if not target_team_name:
         return
 
-    target_team = client.get_team_by_name(target_team_name.lower().replace(" ", "-"))
+    target_team = client.get_team_by_name(slugify(target_team_name))
     if not target_team:
         logger.warning(f"Default team {target_team_name} not found, skipping sync.")
         return
@@ -226,43 +356,38 @@ def sync_team_members(csv_rows: list[Dict], config: Dict, client: MattermostClie
     team_id = target_team["id"]
     current_members = client.get_team_members(team_id)
 
-    # Get set of emails from CSV (normalized)
-    csv_emails = {row.get("email", "").strip().lower() for row in csv_rows if row.get("email")}
-
     logger.info(f"Syncing team '{target_team_name}': Checking {len(current_members)} existing members against {len(csv_emails)} CSV users.")
 
     member_ids = [m["user_id"] for m in current_members]
-    # Fetch details for all team members to get their emails
-    # We do this in chunks if needed, but for now assumption is it fits in memory/request
-    existing_users = client.get_users_by_ids(member_ids)
-    user_map = {u["id"]: u for u in existing_users}
-
-    for member in current_members:
-        user_id = member["user_id"]
-        user = user_map.get(user_id)
-
-        if not user:
-            continue
-
-        email = user.get("email", "").lower()
-        username = user.get("username", "")
-
-        # Check if email is in CSV
-        if email and email not in csv_emails:
-            # Check roles to avoid removing admins accidentally
-            if "system_admin" in user.get("roles", ""):
-                logger.info(f"Skipping removal of system admin: {email}")
-                continue
 
-            logger.info(f"User {email} ({username}) is NOT in CSV. Removing from team...")
-            if not dry_run:
-                try:
-                    client.remove_user_from_team(team_id, user_id)
-                except Exception as e:
-                    logger.error(f"Failed to remove {email} from team: {e}")
-
-def main():
-    args = parse_args()
+    def remove_member(user_id: str, email: str):
+        try:
+            client.remove_user_from_team(team_id, user_id)
+        except Exception as e:
+            logger.error(f"Failed to remove {email} from team: {e}")
+
+    # Fetch member details in API-page-sized chunks and act on each chunk as
+    # it arrives, so memory stays bounded for large teams. Removals are
+    # independent DELETEs, so they run on a small pool instead of serially.
+    with ThreadPoolExecutor(max_workers=IMPORT_WORKERS) as pool:
+        for start in range(0, len(member_ids), 200):
+            for user in client.get_users_by_ids(member_ids[start:start + 200]):
+                email = user.get("email", "").lower()
+                username = user.get("username", "")
+
+                # Check if email is in CSV
+                if email and email not in csv_emails:
+                    # Check roles to avoid removing admins accidentally
+                    if "system_admin" in user.get("roles", ""):
+                        logger.info(f"Skipping removal of system admin: {email}")
+                        continue
+
+                    logger.info(f"User {email} ({username}) is NOT in CSV. Removing from team...")
+                    if not dry_run:
+                        pool.submit(remove_member, user["id"], email)
+
+def main(argv=None):
+    args = parse_args(argv)
     setup_logging(args.debug)
     config = load_config()
 
@@ -273,38 +398,60 @@ def main():
 
     # Auth
     try:
-        url = get_env_var("MM_URL", required=True)
-        # Try token first, then credentials
-        token = get_env_var("MM_TOKEN")
-        if not token:
-            # Try login
-            admin_user = get_env_var("MM_ADMIN_USER") # Optional in .env but needed if no token
-            admin_pass = get_env_var("MM_ADMIN_PASS")
-            if admin_user and admin_pass:
-                logger.info("Authenticating via username/password...")
-                client = MattermostClient.login(url, admin_user, admin_pass)
-            else:
-                logger.error("No MM_TOKEN provided and MM_ADMIN_USER/PASS missing.")
-                sys.exit(1)
-        else:
-            client = MattermostClient(url, token)
-
+        client = build_client(get_auth_config())
     except Exception as e:
         logger.error(f"Authentication failed: {e}")
         sys.exit(1)
 
+    # Resolve or create the default team and list its channels once, before
+    # rows run in parallel: per-row lookups become cache hits and the rows
+    # never race the team create. Dry-run plans offline and needs no warm
+    # cache.
+    if not args.dry_run:
+        try:
+            if config.get("default_team"):
+                get_or_create_team(client, slugify(config["default_team"]), config["default_team"])
+            prewarm_channel_cache(client, config)
+        except Exception as e:
+            logger.warning(f"Could not prewarm channel cache: {e}")
+
     # Process CSV
     try:
-        csv_rows = []
-        with open(args.csv, mode='r', encoding='utf-8-sig') as f:
-            reader = csv.DictReader(f)
-            csv_rows = list(reader)
-
         if args.sync_team:
-            sync_team_members(csv_rows, config, client, args.dry_run)
+            # Syncing only needs the emails, so a first pass collects those
+            # instead of materializing every row.
+            with open(args.csv, mode='r', encoding='utf-8-sig') as f:
+                csv_emails = {
+                    row.get("email", "").strip().lower()
+                    for row in csv.DictReader(f)
+                    if row.get("email")
+                }
+            sync_team_members(csv_emails, config, client, args.dry_run)
 
-        for row in csv_rows:
-            process_row(row, config, client, args.dry_run)
+        with open(args.csv, mode='r', encoding='utf-8-sig') as f:
+            rows = csv.DictReader(f)
+
+            if args.dry_run:
+                # Keep dry-run sequential so the log output stays readable.
+                for row in rows:
+                    process_row(row, config, client, args.dry_run)
+            else:
+                workers = int(config.get("import_concurrency", IMPORT_WORKERS))
+                with ThreadPoolExecutor(max_workers=workers) as executor:
+                    # Submit in windows so only a handful of rows (and their
+                    # futures) are resident at a time, even for huge CSVs.
+                    pending = []
+                    for row in rows:
+                        pending.append(executor.submit(process_row, row, config, client, args.dry_run))
+                        if len(pending) >= workers * 4:
+                            for future in pending:
+                                future.result()
+                            pending = []
+                    for future in pending:
+                        future.result()
+
+                # One bulk request per channel for the memberships queued above.
+                flush_channel_adds(client)
 
     except FileNotFoundError:
         logger.error(f"CSV file not found: {args.csv}")
@@ -1,17 +1,104 @@
+import threading
+import time
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from typing import Dict, Any, Optional, List
 from utils import get_logger
 
+try:
+    # Optional: faster JSON encode/decode for runs with many API calls.
+    import orjson
+except ImportError:
+    orjson = None
+
 logger = get_logger(__name__)
 
+# How often to retry a request the server answered with 429 Too Many Requests.
+RATE_LIMIT_RETRIES = 3
+
+def _build_adapter() -> HTTPAdapter:
+    """Pooled adapter with transparent retries for transient failures.
+
+    Connection errors and 502/503/504 are retried with backoff for
+    idempotent methods only, so a flaky proxy or restarting server does not
+    abort a bulk run. 429 is deliberately excluded: _request handles it
+    itself so the Retry-After header is honored and the wait is logged.
+    respect_retry_after_header must be off for that to hold — urllib3
+    otherwise sleeps on any Retry-After (429 included) inside the transport,
+    silently and while the bulkhead slot is held.
+    """
+    retry = Retry(
+        total=3,
+        connect=3,
+        read=2,
+        backoff_factor=0.5,
+        status_forcelist=(502, 503, 504),
+        raise_on_status=False,
+        respect_retry_after_header=False,
+    )
+    return HTTPAdapter(pool_connections=4, pool_maxsize=16, max_retries=retry)
+
 class TeamMemberLimitExceededError(Exception):
     """Raised when the team has reached its member limit."""
     pass
 
+class MattermostUnavailableError(Exception):
+    """Raised when the circuit breaker is open and calls fail fast."""
+    pass
+
+class _CircuitBreaker:
+    """Consecutive-failure circuit breaker (closed -> open -> half-open).
+
+    After `threshold` consecutive connection failures, calls fail fast with
+    MattermostUnavailableError for `reset_timeout` seconds instead of each
+    waiting out its own socket timeout. Once the cooldown expires, one call
+    is let through as a probe; its outcome re-opens or closes the circuit.
+    """
+
+    def __init__(self, threshold: int = 5, reset_timeout: float = 30.0):
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._opened_at = 0.0
+
+    def check(self):
+        """Raises if the circuit is open and the cooldown has not expired."""
+        with self._lock:
+            if self._failures < self.threshold:
+                return
+            remaining = self._opened_at + self.reset_timeout - time.monotonic()
+            if remaining > 0:
+                raise MattermostUnavailableError(
+                    f"Mattermost unreachable ({self._failures} consecutive "
+                    f"connection failures); retrying in {remaining:.0f}s"
+                )
+            # Cooldown over: let this call through as the half-open probe.
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._failures >= self.threshold:
+                self._opened_at = time.monotonic()
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+
+def build_client(auth) -> 'MattermostClient':
+    """Creates a client from an AuthConfig, preferring a token over credentials."""
+    if auth.token:
+        return MattermostClient(auth.url, auth.token)
+    if auth.admin_user and auth.admin_pass:
+        logger.info("Authenticating via username/password...")
+        return MattermostClient.login(auth.url, auth.admin_user, auth.admin_pass)
+    raise ValueError("No MM_TOKEN provided and MM_ADMIN_USER/PASS missing.")
+
 class MattermostClient:
     """Client for interacting with the Mattermost API."""
 
-    def __init__(self, url: str, token: str):
+    def __init__(self, url: str, token: str, max_inflight: int = 10):
         """Initializes the client with URL and token."""
         self.url = url.rstrip("/")
         self.token = token
@@ -21,6 +108,57 @@ class MattermostClient:
             "X-Requested-With": "XMLHttpRequest", # Often needed for MM API
         }
         self.api_url = f"{self.url}/api/v4"
+        # Persistent session so urllib3 reuses keep-alive connections instead of
+        # doing a full TCP+TLS handshake per API call. The pool is sized to
+        # cover the thread counts the scripts run with.
+        self.session = requests.Session()
+        self.session.headers.update(self.headers)
+        adapter = _build_adapter()
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        # Bulkhead: cap in-flight requests regardless of how many threads the
+        # calling script spins up, so bursts queue here instead of tripping
+        # the server's rate limiter. Kept below the adapter's pool_maxsize so
+        # no request ever waits on a pooled connection.
+        self._bulkhead = threading.BoundedSemaphore(max_inflight)
+        # Fail fast during sustained outages instead of serially waiting out
+        # socket timeouts for every queued call.
+        self._breaker = _CircuitBreaker()
+        # Per-run lookup caches shared by all scripts. Only hits are stored,
+        # since a miss is often followed by a create for the same name; create
+        # calls write through so later lookups are free.
+        self._cache_lock = threading.Lock()
+        self._teams_by_name: Dict[str, Dict] = {}
+        self._channels_by_name: Dict[tuple, Dict] = {}
+        self._users_by_email: Dict[str, Dict] = {}
+
+    def invalidate_cache(self):
+        """Drops all cached lookups (for long-running processes)."""
+        with self._cache_lock:
+            self._teams_by_name.clear()
+            self._channels_by_name.clear()
+            self._users_by_email.clear()
+
+    def _cache_team(self, team: Dict):
+        with self._cache_lock:
+            self._teams_by_name[team["name"]] = team
+
+    def _cache_channel(self, channel: Dict):
+        with self._cache_lock:
+            self._channels_by_name[(channel["team_id"], channel["name"])] = channel
+
+    def _cache_user(self, user: Dict):
+        email = user.get("email")
+        if email:
+            with self._cache_lock:
+                self._users_by_email[email.lower()] = user
+
+    def _evict_user(self, user_id: str):
+        """Drops a user's cached entry after a mutation so lookups re-fetch."""
+        with self._cache_lock:
+            for email, user in list(self._users_by_email.items()):
+                if user.get("id") == user_id:
+                    del self._users_by_email[email]
 
     @classmethod
     def login(cls, url: str, login_id: str, password: str) -> 'MattermostClient':
@@ -28,59 +166,124 @@ class MattermostClient:
         url = url.rstrip("/")
         api_url = f"{url}/api/v4"
         data = {"login_id": login_id, "password": password}
+        # Short-lived session so the login POST goes through the same pooled
+        # transport and retry policy as API calls.
+        session = requests.Session()
+        adapter = _build_adapter()
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
         try:
-            response = requests.post(f"{api_url}/users/login", json=data)
+            response = session.post(f"{api_url}/users/login", json=data)
             response.raise_for_status()
             token = response.headers.get("Token")
             if not token:
                 raise ValueError("Login successful but no token returned in headers.")
             return cls(url, token)
         except requests.exceptions.RequestException as e:
-             logger.error(f"Login failed: {e}")
+             logger.error("Login failed: %s", e)
              raise
+        finally:
+            session.close()
+
+    @staticmethod
+    def _retry_after_delay(response, attempt: int) -> float:
+        """Delay before retrying a rate-limited request, honoring Retry-After."""
+        retry_after = response.headers.get("Retry-After")
+        if retry_after:
+            try:
+                return float(retry_after)
+            except ValueError:
+                pass
+        return float(2 ** attempt)
 
     def _request(self, method: str, endpoint: str, data: Dict = None, params: Dict = None, expected_status_codes: List[int] = None) -> Any:
         """Internal method to handle requests with error handling."""
         url = f"{self.api_url}{endpoint}"
-        try:
-            response = requests.request(
-                method, url, headers=self.headers, json=data, params=params
-            )
-            response.raise_for_status()
-            # Handle empty content (e.g. 204 No Content)
-            if not response.content:
-                return {}
-            return response.json()
-        except requests.exceptions.RequestException as e:
-            is_expected = False
-            if expected_status_codes and isinstance(e, requests.exceptions.HTTPError) and e.response is not None:
-                if e.response.status_code in expected_status_codes:
-                     is_expected = True
-
-            if not is_expected:
-                error_msg = f"API Request Failed: {method} {url} - {e}"
-                if hasattr(e, 'response') and e.response is not None:
-                    error_msg += f" | Response: {e.response.text}"
-                logger.error(error_msg)
-            else:
-                logger.debug(f"Expected API Error: {method} {url} - {e}")
-            raise
+        for attempt in range(RATE_LIMIT_RETRIES + 1):
+            try:
+                self._breaker.check()
+                # The semaphore covers only the HTTP call itself, so a thread
+                # sleeping in rate-limit backoff doesn't hold a slot.
+                with self._bulkhead:
+                    if orjson is not None and data is not None:
+                        # Pre-encoded body; Content-Type is already set on the session.
+                        response = self.session.request(
+                            method, url, data=orjson.dumps(data), params=params
+                        )
+                    else:
+                        response = self.session.request(
+                            method, url, json=data, params=params
+                        )
+                # Any response at all means the server is up; HTTP errors
+                # below are application-level and don't count as outages.
+                self._breaker.record_success()
+                response.raise_for_status()
+                # Handle empty content (e.g. 204 No Content)
+                if not response.content:
+                    return {}
+                if orjson is not None:
+                    return orjson.loads(response.content)
+                return response.json()
+            except requests.exceptions.RequestException as e:
+                if isinstance(e, (requests.exceptions.ConnectionError, requests.exceptions.Timeout)):
+                    self._breaker.record_failure()
+                status_code = None
+                if isinstance(e, requests.exceptions.HTTPError) and e.response is not None:
+                    status_code = e.response.status_code
+
+                # Back off and retry only when the server actually rate-limited us.
+                if status_code == 429 and attempt < RATE_LIMIT_RETRIES:
+                    delay = self._retry_after_delay(e.response, attempt)
+                    logger.warning("Rate limited: %s %s. Retrying in %.1fs...", method, url, delay)
+                    time.sleep(delay)
+                    continue
+
+                is_expected = bool(expected_status_codes and status_code in expected_status_codes)
+
+                if not is_expected:
+                    response = getattr(e, 'response', None)
+                    if response is not None:
+                        logger.error("API Request Failed: %s %s - %s | Response: %s", method, url, e, response.text)
+                    else:
+                        logger.error("API Request Failed: %s %s - %s", method, url, e)
+                else:
+                    logger.debug("Expected API Error: %s %s - %s", method, url, e)
+                raise
 
     # User Management
     def get_users_by_ids(self, user_ids: List[str]) -> List[Dict]:
         """Fetches users by a list of IDs."""
         if not user_ids:
             return []
-        return self._request("POST", "/users/ids", data=user_ids)
+        users = self._request("POST", "/users/ids", data=user_ids)
+        for user in users:
+            self._cache_user(user)
+        return users
 
     def get_user_by_email(self, email: str) -> Optional[Dict]:
+        with self._cache_lock:
+            cached = self._users_by_email.get(email.lower())
+        if cached:
+            return cached
         try:
-            return self._request("GET", f"/users/email/{email}", expected_status_codes=[404])
+            user = self._request("GET", f"/users/email/{email}", expected_status_codes=[404])
+            if user:
+                self._cache_user(user)
+            return user
         except requests.exceptions.HTTPError as e:
             if e.response.status_code == 404:
                 return None
             raise
 
+    def get_users_by_usernames(self, usernames: List[str]) -> List[Dict]:
+        """Fetches users by a list of usernames in one request."""
+        if not usernames:
+            return []
+        users = self._request("POST", "/users/usernames", data=usernames)
+        for user in users:
+            self._cache_user(user)
+        return users
+
     def get_user_by_username(self, username: str) -> Optional[Dict]:
         try:
             return self._request("GET", f"/users/username/{username}", expected_status_codes=[404])
@@ -100,8 +303,11 @@ class MattermostClient:
             "nickname": nickname,
             "password": password,
         }
-        logger.info(f"Creating user: {username} ({email})")
-        return self._request("POST", "/users", data=data)
+        logger.info("Creating user: %s (%s)", username, email)
+        user = self._request("POST", "/users", data=data)
+        if user:
+            self._cache_user(user)
+        return user
 
     def update_user(self, user_id: str, first_name: str, last_name: str, position: str = "", nickname: str = "") -> Dict:
         """Updates user profile."""
@@ -111,37 +317,59 @@ class MattermostClient:
             "position": position,
             "nickname": nickname,
         }
-        logger.info(f"Updating user {user_id}")
-        return self._request("PUT", f"/users/{user_id}/patch", data=data)
+        logger.info("Updating user %s", user_id)
+        user = self._request("PUT", f"/users/{user_id}/patch", data=data)
+        # A patch can change the email, so drop the old entry before re-caching.
+        self._evict_user(user_id)
+        if user:
+            self._cache_user(user)
+        return user
 
     def disable_user(self, user_id: str) -> Dict:
         """Disables a user."""
-        logger.info(f"Disabling user {user_id}")
-        return self._request("DELETE", f"/users/{user_id}")
+        logger.info("Disabling user %s", user_id)
+        result = self._request("DELETE", f"/users/{user_id}")
+        self._evict_user(user_id)
+        return result
 
     def activate_user(self, user_id: str) -> Dict:
         """Activates a user."""
-        logger.info(f"Activating user {user_id}")
+        logger.info("Activating user %s", user_id)
         data = {"active": True}
-        return self._request("PUT", f"/users/{user_id}/active", data=data)
+        result = self._request("PUT", f"/users/{user_id}/active", data=data)
+        self._evict_user(user_id)
+        return result
 
     # Team Management
     def get_team_by_name(self, name: str) -> Optional[Dict]:
+        with self._cache_lock:
+            cached = self._teams_by_name.get(name)
+        if cached:
+            return cached
         try:
-            return self._request("GET", f"/teams/name/{name}", expected_status_codes=[404])
+            team = self._request("GET", f"/teams/name/{name}", expected_status_codes=[404])
+            if team:
+                self._cache_team(team)
+            return team
         except requests.exceptions.HTTPError as e:
             if e.response.status_code == 404:
                 return None
             raise
 
     def get_team_members(self, team_id: str) -> List[Dict]:
-        """Returns a list of team members."""
-        # Note: Pagination might be needed for large teams, but default page size is usually 60 or 200.
-        # We'll stick to one page explicitly requesting a large number?
-        # Or better, just use the helper to get all?
-        # For this specific case, simpler is better. Standard endpoint returns paged results.
-        # We'll request 200 users for now.
-        return self._request("GET", f"/teams/{team_id}/members", params={"per_page": 200})
+        """Returns all team members, following pagination."""
+        members = []
+        page = 0
+        per_page = 200
+        while True:
+            batch = self._request(
+                "GET", f"/teams/{team_id}/members",
+                params={"page": page, "per_page": per_page}
+            )
+            members.extend(batch)
+            if len(batch) < per_page:
+                return members
+            page += 1
 
     def create_team(self, name: str, display_name: str) -> Dict:
          """Creates a new team."""
@@ -150,12 +378,15 @@ class MattermostClient:
              "display_name": display_name,
              "type": "O", # Open team
          }
-         logger.info(f"Creating team: {name}")
-         return self._request("POST", "/teams", data=data)
+         logger.info("Creating team: %s", name)
+         team = self._request("POST", "/teams", data=data)
+         if team:
+             self._cache_team(team)
+         return team
 
     def remove_user_from_team(self, team_id: str, user_id: str) -> Dict:
         """Removes a user from a team."""
-        logger.info(f"Removing user {user_id} from team {team_id}")
+        logger.info("Removing user %s from team %s", user_id, team_id)
         return self._request("DELETE", f"/teams/{team_id}/members/{user_id}")
 
     def add_user_to_team(self, team_id: str, user_id: str) -> Dict:
@@ -167,28 +398,54 @@ class MattermostClient:
         try:
             return self._request("POST", f"/teams/{team_id}/members", data=data)
         except requests.exceptions.HTTPError as e:
-             if e.response and "app.team.join_user_to_team.save_member.exception" in str(e.response.text):
-                 logger.debug(f"User {user_id} already in team {team_id}")
+             # .text re-decodes the body on each access; read it once.
+             body = e.response.text if e.response is not None else ""
+             if "app.team.join_user_to_team.save_member.exception" in body:
+                 logger.debug("User %s already in team %s", user_id, team_id)
                  return {} # Idempotent-ish
              if e.response.status_code == 400:
                   # Check for max accounts error specifically to raise it
-                  if "max_accounts.app_error" in e.response.text:
-                      logger.warning(f"Team limit reached when adding user {user_id} to team {team_id}.")
+                  if "max_accounts.app_error" in body:
+                      logger.warning("Team limit reached when adding user %s to team %s.", user_id, team_id)
                       raise TeamMemberLimitExceededError(f"Team {team_id} is full.")
 
-                  logger.warning(f"User {user_id} likely already in team {team_id} (400 returned). Response: {e.response.text}")
+                  logger.warning("User %s likely already in team %s (400 returned). Response: %s", user_id, team_id, body)
                   return {}
              raise
 
     # Channel Management
     def get_channel_by_name(self, team_id: str, channel_name: str) -> Optional[Dict]:
+        with self._cache_lock:
+            cached = self._channels_by_name.get((team_id, channel_name))
+        if cached:
+            return cached
         try:
-            return self._request("GET", f"/teams/{team_id}/channels/name/{channel_name}", expected_status_codes=[404])
+            channel = self._request("GET", f"/teams/{team_id}/channels/name/{channel_name}", expected_status_codes=[404])
+            if channel:
+                self._cache_channel(channel)
+            return channel
         except requests.exceptions.HTTPError as e:
             if e.response.status_code == 404:
                 return None
             raise
 
+    def get_channels_for_team(self, team_id: str) -> List[Dict]:
+        """Returns all channels in a team, following pagination."""
+        channels = []
+        page = 0
+        per_page = 200
+        while True:
+            batch = self._request(
+                "GET", f"/teams/{team_id}/channels",
+                params={"page": page, "per_page": per_page}
+            )
+            channels.extend(batch)
+            if len(batch) < per_page:
+                for channel in channels:
+                    self._cache_channel(channel)
+                return channels
+            page += 1
+
     def create_channel(self, team_id: str, name: str, display_name: str, channel_type: str = "P") -> Dict:
         data = {
             "team_id": team_id,
@@ -196,14 +453,23 @@ class MattermostClient:
             "display_name": display_name,
             "type": channel_type # 'O' for Open, 'P' for Private
         }
-        logger.info(f"Creating channel: {name} (Type: {channel_type})")
-        return self._request("POST", "/channels", data=data)
+        logger.info("Creating channel: %s (Type: %s)", name, channel_type)
+        channel = self._request("POST", "/channels", data=data)
+        if channel:
+            self._cache_channel(channel)
+        return channel
 
     def update_channel_privacy(self, channel_id: str, privacy: str) -> Dict:
         """Updates channel privacy ('O' for Open, 'P' for Private)."""
         data = {"privacy": privacy}
-        logger.info(f"Updating channel {channel_id} privacy to: {privacy}")
-        return self._request("PUT", f"/channels/{channel_id}/privacy", data=data)
+        logger.info("Updating channel %s privacy to: %s", channel_id, privacy)
+        result = self._request("PUT", f"/channels/{channel_id}/privacy", data=data)
+        # Keep any cached copy in sync so other callers don't re-convert.
+        with self._cache_lock:
+            for channel in self._channels_by_name.values():
+                if channel["id"] == channel_id:
+                    channel["type"] = privacy
+        return result
 
     def add_user_to_channel(self, channel_id: str, user_id: str) -> Dict:
         data = {
@@ -212,18 +478,33 @@ class MattermostClient:
         try:
             return self._request("POST", f"/channels/{channel_id}/members", data=data)
         except requests.exceptions.HTTPError as e:
-             if e.response and "app.channel.create_member.user_already_in_channel.app_error" in str(e.response.text): # Check exact error
-                 logger.debug(f"User {user_id} already in channel {channel_id}")
+             # .text re-decodes the body on each access; read it once.
+             body = e.response.text if e.response is not None else ""
+             if "app.channel.create_member.user_already_in_channel.app_error" in body: # Check exact error
+                 logger.debug("User %s already in channel %s", user_id, channel_id)
                  return {}
              if e.response.status_code == 400: # Sometimes returns 400 for already existing
-                  logger.warning(f"User {user_id} likely already in channel {channel_id} (400 returned). Response: {e.response.text}")
+                  logger.warning("User %s likely already in channel %s (400 returned). Response: %s", user_id, channel_id, body)
                   return {}
              raise
 
+    def add_users_to_channel(self, channel_id: str, user_ids: List[str]) -> List[Dict]:
+        """Adds multiple users to a channel in a single request."""
+        if not user_ids:
+            return []
+        data = {"user_ids": user_ids}
+        logger.info("Adding %d users to channel %s", len(user_ids), channel_id)
+        try:
+            return self._request("POST", f"/channels/{channel_id}/members", data=data)
+        except requests.exceptions.HTTPError:
+            # Older servers don't accept 'user_ids'; fall back to per-user calls.
+            logger.warning("Bulk add to channel %s failed. Falling back to per-user requests.", channel_id)
+            return [self.add_user_to_channel(channel_id, user_id) for user_id in user_ids]
+
     def set_channel_member_roles(self, channel_id: str, user_id: str, roles: str) -> Dict:
         """Updates a user's roles in a channel."""
         data = {"roles": roles}
-        logger.info(f"Setting roles '{roles}' for user {user_id} in channel {channel_id}")
+        logger.info("Setting roles '%s' for user %s in channel %s", roles, user_id, channel_id)
         return self._request("PUT", f"/channels/{channel_id}/members/{user_id}/roles", data=data)
 
     def remove_user_from_channel(self, channel_id: str, user_id: str) -> Dict:
@@ -10,81 +10,95 @@ def parse_args():
     parser.add_argument("--output", default="users.csv", help="Path to output CSV (default: users.csv)")
     return parser.parse_args()
 
+# Team labels are a single letter or letter+digit (e.g. H1, D, A2).
+TEAM_RE = re.compile(r"^[A-Za-z]\d?$")
+
+# Allowed tags (case-insensitive for checking)
+ALLOWED_TAGS = frozenset({'trainer', 'tientjeslid', 'trainingmember', 'captain', 'tc', 'bestuur'})
+
 def parse_labels(labels_str: str) -> (str, List[str]):
     """
     Parses 'Labels' field.
     Team: Single letter, or Letter+Digit (e.g., H1, D, A2).
     Tags: All other labels (filtered by allow list).
+    'recreant' anywhere wins over a team label and is never a tag.
     """
     if not labels_str:
         return "", []
 
-    parts = [p.strip() for p in labels_str.split("^") if p.strip()]
-
     team = ""
     tags = []
 
-    team_regex = re.compile(r"^[A-Za-z]\d?$") # Single letter or Letter+Digit
-
-    # Allowed tags (case-insensitive for checking)
-    ALLOWED_TAGS = {'trainer', 'tientjeslid', 'trainingmember', 'captain', 'tc', 'bestuur'}
-
-    # Check for 'recreant' priority
-    recreant_match = next((p for p in parts if "recreant" in p.lower()), None)
-    if recreant_match:
-        team = "recreant"
-
-    for part in parts:
-        # If this part was the one containing recreant, skip adding it to tags
-        if recreant_match and part == recreant_match:
+    for part in labels_str.split("^"):
+        part = part.strip()
+        if not part:
             continue
-
-        # If we haven't found a team yet (recreant wasn't there), and this looks like a team, take it.
-        if not team and team_regex.match(part):
+        lowered = part.lower()
+        if "recreant" in lowered:
+            team = "recreant"
+        elif not team and TEAM_RE.match(part):
             team = part
-        else:
-            # Check allow list
-            if part.lower() in ALLOWED_TAGS:
-                tags.append(part)
+        elif lowered in ALLOWED_TAGS:
+            tags.append(part)
 
     return team, tags
 
 def main():
     args = parse_args()
 
-    output_rows = []
+    fieldnames = ["firstname", "lastname", "email", "team", "tags"]
 
     try:
         with open(args.input_file, mode='r', encoding='utf-8-sig') as infile:
-            # Semicolon separated
-            reader = csv.DictReader(infile, delimiter=';')
-
-            for row in reader:
-                # Extract fields
-                firstname = row.get("Voornaam", "").strip()
-
-                tussenvoegsel = row.get("Tussenvoegsel", "").strip()
-                achternaam = row.get("Achternaam", "").strip()
-                lastname = f"{tussenvoegsel} {achternaam}".strip()
-
-                email = row.get("E-mailadres voor contact", "").strip()
-
-                labels = row.get("Labels", "")
-                team, tags_list = parse_labels(labels)
-
-                # Add "Extern lidnummer" if present
-                extern_lidnummer = row.get("Extern lidnummer", "").strip()
-                if extern_lidnummer:
-                    tags_list.append(extern_lidnummer)
-
-                if email:
-                    output_rows.append({
-                        "firstname": firstname,
-                        "lastname": lastname,
-                        "email": email,
-                        "team": team,
-                        "tags": ",".join(tags_list)
-                    })
+            # Semicolon separated. Plain csv.reader with a one-time column
+            # index map: no dict built per row, just list indexing.
+            reader = csv.reader(infile, delimiter=';')
+            header = next(reader, [])
+            idx = {name.strip(): i for i, name in enumerate(header)}
+
+            def field(row: List[str], name: str) -> str:
+                i = idx.get(name)
+                return row[i].strip() if i is not None and i < len(row) else ""
+
+            # Only open (truncate) the output once the input is readable, so
+            # a bad input path can't wipe a previously prepared users.csv.
+            # Rows then stream straight through: no output_rows list, O(1)
+            # memory, and stdout shows progress as it runs.
+            outfile = sys.stdout
+            if args.output and args.output != "stdout":
+                try:
+                    outfile = open(args.output, "w", encoding='utf-8', newline='')
+                except OSError as e:
+                    print(f"Error opening output file: {e}", file=sys.stderr)
+                    sys.exit(1)
+
+            try:
+                writer = csv.writer(outfile)
+                writer.writerow(fieldnames)
+
+                for row in reader:
+                    # Extract fields
+                    firstname = field(row, "Voornaam")
+
+                    tussenvoegsel = field(row, "Tussenvoegsel")
+                    achternaam = field(row, "Achternaam")
+                    lastname = f"{tussenvoegsel} {achternaam}".strip()
+
+                    email = field(row, "E-mailadres voor contact")
+
+                    labels = field(row, "Labels")
+                    team, tags_list = parse_labels(labels)
+
+                    # Add "Extern lidnummer" if present
+                    extern_lidnummer = field(row, "Extern lidnummer")
+                    if extern_lidnummer:
+                        tags_list.append(extern_lidnummer)
+
+                    if email:
+                        writer.writerow((firstname, lastname, email, team, ",".join(tags_list)))
+            finally:
+                if outfile is not sys.stdout:
+                    outfile.close()
 
     except FileNotFoundError:
         print(f"Error: Input file '{args.input_file}' not found.", file=sys.stderr)
@@ -93,24 +107,5 @@ def main():
         print(f"Error processing file: {e}", file=sys.stderr)
         sys.exit(1)
 
-    # Write output
-    fieldnames = ["firstname", "lastname", "email", "team", "tags"]
-
-    outfile = sys.stdout
-    if args.output and args.output != "stdout":
-        try:
-            outfile = open(args.output, "w", encoding='utf-8', newline='')
-        except OSError as e:
-            print(f"Error opening output file: {e}", file=sys.stderr)
-            sys.exit(1)
-
-    try:
-        writer = csv.DictWriter(outfile, fieldnames=fieldnames)
-        writer.writeheader()
-        writer.writerows(output_rows)
-    finally:
-        if outfile is not sys.stdout:
-            outfile.close()
-
 if __name__ == "__main__":
     main()
@@ -1,9 +1,10 @@
 import pytest
 import os
 import csv
-import sys
+import random
 import time
-import subprocess
+import disable_users
+import import_users
 from mm_client import MattermostClient
 from config_loader import get_env_var, load_config
 
@@ -28,7 +29,7 @@ def setup_environment():
     # Force localhost for testing, ignoring .env production URL
     os.environ["MM_URL"] = "http://localhost:8065"
 
-    # Load .env variables into os.environ so subprocesses see them
+    # Load .env variables into os.environ so the scripts under test see them
     load_config() # This triggers load_dotenv in config_loader
     # Ensure our override persists after load_config (which might reload .env)
     os.environ["MM_URL"] = "http://localhost:8065"
@@ -40,16 +41,19 @@ def client():
     admin_user = get_env_var("MM_ADMIN_USER", TEST_ADMIN_USER)
     admin_pass = get_env_var("MM_ADMIN_PASS", TEST_ADMIN_PASS)
 
-    # Wait for service readiness
-    max_retries = 30
-    for i in range(max_retries):
+    # Wait for service readiness. Exponential backoff with jitter: quick
+    # retries while the server warms up, without hammering it for the full
+    # window when it is genuinely down.
+    deadline = time.monotonic() + 60
+    delay = 0.1
+    while True:
         try:
-            client = MattermostClient.login(url, admin_user, admin_pass)
-            return client
+            return MattermostClient.login(url, admin_user, admin_pass)
         except Exception as e:
-            if i == max_retries - 1:
+            if time.monotonic() >= deadline:
                 pytest.fail(f"Could not connect to Mattermost: {e}")
-            time.sleep(1)
+            time.sleep(delay + random.uniform(0, delay * 0.2))
+            delay = min(delay * 2, 5.0)
 
 @pytest.fixture(scope="session")
 def prepare_csv():
@@ -79,27 +83,22 @@ def test_health_check(client):
     # If client fixture passed, login worked, so health is good.
     assert client.token is not None
 
-def test_import_users_dry_run(client, prepare_csv):
+def test_import_users_dry_run(client, prepare_csv, caplog):
     """Test import script in dry-run mode."""
-    cmd = [sys.executable, "import_users.py", "--csv", TEST_CSV, "--dry-run"]
-    result = subprocess.run(cmd, capture_output=True, text=True)
-    assert result.returncode == 0
+    # In-process call: no interpreter startup or fresh login per test.
+    with caplog.at_level("INFO"):
+        import_users.main(["--csv", TEST_CSV, "--dry-run"])
     # On repeat runs, it will say "User exists" instead of "Creating user"
-    assert f"Creating user: {TEST_USER_EMAIL}" in result.stderr or f"Creating user: {TEST_USER_EMAIL}" in result.stdout or f"User exists: {TEST_USER_EMAIL}" in result.stderr or f"User exists: {TEST_USER_EMAIL}" in result.stdout
+    assert f"Creating user: {TEST_USER_EMAIL}" in caplog.text or f"User exists: {TEST_USER_EMAIL}" in caplog.text
 
-def test_import_users_execute(client, prepare_csv):
+def test_import_users_execute(client, prepare_csv, caplog):
     """Test actual import execution."""
     # Ensure team exists first (script should handle it, but for test stability)
     # The script creates the team if missing.
 
     # Run Import
-    cmd = [sys.executable, "import_users.py", "--csv", TEST_CSV, "--execute", "--debug"]
-    # Pass current env to subprocess
-    result = subprocess.run(cmd, capture_output=True, text=True, env=os.environ, cwd=os.path.dirname(os.path.abspath(__file__)))
-
-    print(result.stdout)
-    print(result.stderr)
-    assert result.returncode == 0
+    with caplog.at_level("DEBUG"):
+        import_users.main(["--csv", TEST_CSV, "--execute", "--debug"])
 
     # Verify User Created
     user = client.get_user_by_email(TEST_USER_EMAIL)
@@ -119,17 +118,17 @@ def test_disable_user(client):
     user = client.get_user_by_email(email)
 
     if not user:
-        client.create_user(email, "tobedisabled", "To", "BeDisabled")
+        user = client.create_user(email, "tobedisabled", "To", "BeDisabled")
     else:
         # Reactivate if it was disabled in a previous test run
         if user.get("delete_at", 0) > 0:
             client.activate_user(user["id"])
 
-    cmd = [sys.executable, "disable_users.py", email, "--execute"]
-    result = subprocess.run(cmd, capture_output=True, text=True, env=os.environ, cwd=os.path.dirname(os.path.abspath(__file__)))
-    assert result.returncode == 0
+    disable_users.main([email, "--execute"])
 
-    # Verify
-    user = client.get_user_by_email(email)
+    # Verify by id: the disable ran on the script's own client, so this
+    # client's email cache never saw the mutation; get_users_by_ids always
+    # hits the server.
+    user = client.get_users_by_ids([user["id"]])[0]
     # Disabled users usually have 'delete_at' set > 0
     assert user["delete_at"] > 0
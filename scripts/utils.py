@@ -1,5 +1,6 @@
 import logging
 import sys
+from functools import lru_cache
 
 def setup_logging(debug: bool = False):
     """Configures logging for the application."""
@@ -15,6 +16,11 @@ def get_logger(name: str):
     """Returns a logger instance with the given name."""
     return logging.getLogger(name)
 
+@lru_cache(maxsize=256)
+def slugify(name: str) -> str:
+    """Converts a display name to a Mattermost slug (lowercase, dashes)."""
+    return name.lower().replace(" ", "-")
+
 def confirm_action(message: str) -> bool:
     """Asks the user for confirmation (Y/n)."""
     response = input(f"{message} (y/N): ").strip().lower()